@@ -0,0 +1,6 @@
+"""
+Tools to benchmark the stages of a survey run on synthetic focal planes and tiles.
+"""
+
+import suite
+
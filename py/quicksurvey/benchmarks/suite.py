@@ -0,0 +1,401 @@
+"""
+Benchmarks for the hot paths of a survey run.
+
+Synthetic focal planes and target tiles are written to a temporary directory
+for a grid of sizes. Each stage is timed and its peak memory recorded. The
+results can be saved as a baseline and compared against later runs.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import numpy as np
+from astropy.io import fits
+import quicksurvey
+from quicksurvey import util
+from quicksurvey import fiberassign
+from quicksurvey import recordresults
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# How the peak memory is measured: allocations traced by tracemalloc, or the growth
+# of the maximum resident set size of a forked process running the stage.
+if(tracemalloc is not None):
+    MEMORY_METHOD = 'tracemalloc'
+elif((resource is not None) and hasattr(os, 'fork')):
+    MEMORY_METHOD = 'maxrss'
+else:
+    MEMORY_METHOD = None
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Size of the benchmark when a parameter is not being varied.
+DEFAULT_SIZE = {'n_fiber': 1000, 'n_target': 5000, 'n_tiles': 4}
+
+# Values taken by each parameter, one at a time, to measure the scaling.
+DEFAULT_GRID = {'n_fiber': [250, 500, 1000, 2000],
+                'n_target': [1250, 2500, 5000, 10000],
+                'n_tiles': [2, 4, 8]}
+
+# Radius of a tile on the sky, in degrees, and of the focal plane, in mm.
+TILE_RADIUS = 1.6
+PLATE_RADIUS = 400.0
+
+# Separation in RA between consecutive tile centers, in degrees.
+TILE_SPACING = 1.5
+
+def make_fiber_file(filename, n_fiber):
+    """
+    Writes a focal plane with fibers on a hexagonal grid.
+
+    Args:
+        filename (string): name of the FITS file to write
+        n_fiber (int): approximate number of fibers
+    Returns:
+        filename (string)
+    """
+    pitch = np.sqrt(np.pi * PLATE_RADIUS**2 / (n_fiber * np.sqrt(3.0) / 2.0))
+    n_side = int(PLATE_RADIUS / pitch) + 1
+    i, j = np.meshgrid(np.arange(-n_side, n_side + 1), np.arange(-n_side, n_side + 1))
+    x = pitch * (i + 0.5 * (j % 2)).ravel()
+    y = pitch * np.sqrt(3.0) / 2.0 * j.ravel()
+    radius = np.sqrt(x**2 + y**2)
+    keep = radius.argsort()[:n_fiber]
+    x = x[keep]
+    y = y[keep]
+    fiber = np.arange(np.size(x))
+
+    c0 = fits.Column(name='x', format='D', array=x)
+    c1 = fits.Column(name='y', format='D', array=y)
+    c2 = fits.Column(name='z', format='D', array=np.zeros(np.size(x)))
+    c3 = fits.Column(name='fiber', format='J', array=fiber)
+    c4 = fits.Column(name='positioner', format='J', array=fiber)
+    c5 = fits.Column(name='spectrograph', format='J', array=fiber // 500)
+    table_hdu = fits.BinTableHDU.from_columns([c0, c1, c2, c3, c4, c5])
+    fits.HDUList([fits.PrimaryHDU(), table_hdu]).writeto(filename)
+    return filename
+
+def make_tile_files(directory, n_tiles, n_target, seed=0):
+    """
+    Writes overlapping tiles drawn from a single target catalog.
+
+    Args:
+        directory (string): directory where the Targets_Tile_*.fits files are written
+        n_tiles (int): number of tiles, placed along a line of constant dec
+        n_target (int): approximate number of targets in each tile
+        seed (int): seed for the random generator. Defaults to 0.
+    Returns:
+        tile_filename_list (string): list with the names of the files
+    Note:
+        Consecutive tiles overlap, so some targets are present in more than one tile.
+    """
+    rng = np.random.RandomState(seed)
+    tile_ra = 150.0 + TILE_SPACING * np.arange(n_tiles)
+    tile_dec = np.zeros(n_tiles)
+
+    # the catalog covers a strip around dec=0, where RA and dec distances are comparable
+    ra_min = tile_ra[0] - TILE_RADIUS
+    ra_max = tile_ra[-1] + TILE_RADIUS
+    density = n_target / (np.pi * TILE_RADIUS**2)
+    n_catalog = int(density * (ra_max - ra_min) * 2.0 * TILE_RADIUS)
+    ra = rng.uniform(ra_min, ra_max, n_catalog)
+    dec = rng.uniform(-TILE_RADIUS, TILE_RADIUS, n_catalog)
+    objtype = np.array(['ELG', 'LRG', 'QSO'])[rng.randint(0, 3, n_catalog)]
+    target_id = np.arange(n_catalog, dtype=np.int64)
+
+    tile_filename_list = []
+    for i in range(n_tiles):
+        inside = np.where((ra - tile_ra[i])**2 + (dec - tile_dec[i])**2 < TILE_RADIUS**2)[0]
+        c0 = fits.Column(name='TARGETID', format='K', array=target_id[inside])
+        c1 = fits.Column(name='RA', format='D', array=ra[inside])
+        c2 = fits.Column(name='DEC', format='D', array=dec[inside])
+        c3 = fits.Column(name='OBJTYPE', format='10A', array=objtype[inside])
+        table_hdu = fits.BinTableHDU.from_columns([c0, c1, c2, c3])
+        table_hdu.header['TILE_ID'] = i
+        table_hdu.header['TILE_RA'] = tile_ra[i]
+        table_hdu.header['TILE_DEC'] = tile_dec[i]
+        filename = os.path.join(directory, 'Targets_Tile_%06d.fits'%(i))
+        fits.HDUList([fits.PrimaryHDU(), table_hdu]).writeto(filename)
+        tile_filename_list.append(filename)
+    return tile_filename_list
+
+def measure(function, setup=None, repeat=3):
+    """
+    Measures the wall time and the peak memory of a function.
+
+    Args:
+        function (function): called without arguments
+        setup (function): called without arguments before each call to function,
+             it is not measured. Defaults to None.
+        repeat (int): number of timed calls. Defaults to 3.
+    Returns:
+        [time, peak_memory]: the minimum time in seconds over the timed calls, and
+             the peak of memory in bytes of one more call, measured as given by
+             MEMORY_METHOD. peak_memory is None if MEMORY_METHOD is None.
+    Note:
+        The timed calls run without tracing, since tracemalloc slows down the
+        allocations by a large factor. The peak memory is measured in a separate
+        call; without tracemalloc (Python 2) it runs in a forked process, so the
+        changes it makes to the arguments of the function are not kept.
+    """
+    best_time = None
+    for i in range(repeat):
+        if(setup is not None):
+            setup()
+        start = _clock()
+        function()
+        elapsed = _clock() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    peak_memory = None
+    if(MEMORY_METHOD is not None):
+        if(setup is not None):
+            setup()
+        if(MEMORY_METHOD == 'maxrss'):
+            peak_memory = _measure_in_child(function)[1]
+        else:
+            tracemalloc.start()
+            try:
+                function()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return [best_time, peak_memory]
+
+def _measure_in_child(function):
+    """
+    Calls a function in a forked process.
+
+    Returns:
+        [time, peak_memory]: the time in seconds and the growth of the maximum
+             resident set size of the process during the call, in bytes.
+    """
+    # ru_maxrss is in bytes on OS X and in kilobytes elsewhere
+    if(sys.platform == 'darwin'):
+        unit = 1
+    else:
+        unit = 1024
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if(pid == 0):
+        os.close(read_end)
+        status = 0
+        try:
+            start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = _clock()
+            function()
+            elapsed = _clock() - start
+            end_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            message = '%r %d'%(elapsed, (end_rss - start_rss) * unit)
+        except Exception as err:
+            message = 'error %r'%(err)
+            status = 1
+        os.write(write_end, message.encode('ascii'))
+        os.close(write_end)
+        os._exit(status)
+
+    os.close(write_end)
+    chunks = []
+    while True:
+        chunk = os.read(read_end, 4096)
+        if(not chunk):
+            break
+        chunks.append(chunk)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    message = b''.join(chunks).decode('ascii')
+    if(message.startswith('error') or (message == '')):
+        raise RuntimeError('The benchmarked function failed in the child process: %s'%(message))
+    elapsed, peak = message.split()
+    return [float(elapsed), int(peak)]
+
+def run_case(n_fiber, n_target, n_tiles, repeat=3):
+    """
+    Benchmarks all the stages for a single size.
+
+    Args:
+        n_fiber (int): number of fibers
+        n_target (int): approximate number of targets per tile
+        n_tiles (int): number of tiles
+        repeat (int): number of calls of each stage. Defaults to 3.
+    Returns:
+        results (dict): list with one dictionary per stage, holding the keys
+             stage, n_fiber, n_target, n_tiles, time and peak_memory.
+    """
+    directory = tempfile.mkdtemp(prefix='quicksurvey_benchmark_')
+    try:
+        fiber_file = make_fiber_file(os.path.join(directory, 'fiberpos.fits'), n_fiber)
+        tile_filename_list = make_tile_files(directory, n_tiles, n_target)
+        fibers = util.FocalPlaneFibers(fiber_file)
+        tile = util.TargetTile(tile_filename_list[0])
+        survey = util.TargetSurvey(tile_filename_list)
+        graph = fiberassign.reachability.compute_reachability(fibers, tile)
+
+        def reset():
+            fibers.reset_all_available()
+            fibers.reset_all_targets()
+            tile.reset_all_fibers()
+
+        def available():
+            reset()
+            fiberassign.assign.find_available_targets(fibers, tile)
+
+        def selected():
+            available()
+            fiberassign.assign.select_target(fibers, tile, survey)
+
+        stages = [
+            ['radec2xy', None,
+             lambda: util.radec2xy(tile.ra, tile.dec, tile.tile_ra, tile.tile_dec)],
+            ['TargetTile', None, lambda: util.TargetTile(tile_filename_list[0])],
+            ['TargetSurvey', None, lambda: util.TargetSurvey(tile_filename_list)],
+            ['find_available_targets', reset,
+             lambda: fiberassign.assign.find_available_targets(fibers, tile)],
+            ['compute_reachability', None,
+             lambda: fiberassign.reachability.compute_reachability(fibers, tile)],
+            ['apply_reachability', reset,
+             lambda: graph.apply(fibers, tile)],
+            ['select_target', available,
+             lambda: fiberassign.assign.select_target(fibers, tile, survey)],
+            ['repair_collisions', selected,
+             lambda: fiberassign.assign.repair_collisions(fibers, tile)],
+            ['update_global_targets', selected,
+             lambda: recordresults.update.update_global_targets(survey, tile)],
+            ['initialize_observation_files', None,
+             lambda: recordresults.update.initialize_observation_files(tile_filename_list)],
+        ]
+
+        results = []
+        for name, setup, function in stages:
+            elapsed, peak_memory = measure(function, setup=setup, repeat=repeat)
+            results.append({'stage': name, 'n_fiber': n_fiber, 'n_target': n_target,
+                            'n_tiles': n_tiles, 'time': elapsed, 'peak_memory': peak_memory})
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def run_suite(grid=DEFAULT_GRID, default=DEFAULT_SIZE, repeat=3):
+    """
+    Benchmarks all the stages varying one parameter at a time.
+
+    Args:
+        grid (dict): values taken by each of n_fiber, n_target and n_tiles.
+             Defaults to DEFAULT_GRID.
+        default (dict): values of the parameters that are not being varied.
+             Defaults to DEFAULT_SIZE.
+        repeat (int): number of calls of each stage. Defaults to 3.
+    Returns:
+        results (dict): list of dictionaries as returned by run_case.
+    """
+    cases = []
+    for parameter in sorted(grid):
+        for value in grid[parameter]:
+            size = dict(default)
+            size[parameter] = value
+            case = (size['n_fiber'], size['n_target'], size['n_tiles'])
+            if(case not in cases):
+                cases.append(case)
+
+    results = []
+    for n_fiber, n_target, n_tiles in cases:
+        print('Benchmarking n_fiber=%d n_target=%d n_tiles=%d'%(n_fiber, n_target, n_tiles))
+        results.extend(run_case(n_fiber, n_target, n_tiles, repeat=repeat))
+    return results
+
+def save_results(results, filename, default=DEFAULT_SIZE):
+    """
+    Writes the benchmark results to a JSON file.
+
+    Args:
+        results (dict): list of dictionaries as returned by run_suite
+        filename (string): name of the output file
+        default (dict): values of the parameters that were not being varied.
+    """
+    with open(filename, 'w') as f:
+        json.dump({'version': quicksurvey.__version__, 'default': default,
+                   'memory_method': MEMORY_METHOD, 'results': results}, f, indent=1, sort_keys=True)
+
+def load_results(filename):
+    """
+    Reads benchmark results written by save_results.
+
+    Args:
+        filename (string): name of the JSON file
+    Returns:
+        [results, default, memory_method]: the list of results, the default size of
+             the parameters and the method used to measure the peak memory.
+    """
+    with open(filename) as f:
+        data = json.load(f)
+    return [data['results'], data['default'], data.get('memory_method')]
+
+def scaling_exponents(results, default=DEFAULT_SIZE):
+    """
+    Fits time ~ size**exponent for each stage and parameter.
+
+    Args:
+        results (dict): list of dictionaries as returned by run_suite
+        default (dict): values of the parameters that were not being varied.
+    Returns:
+        exponents (dict): exponents[stage][parameter] is the slope of log(time)
+             against log(parameter), when the parameter has been varied.
+    """
+    exponents = {}
+    for parameter in sorted(default):
+        others = [p for p in default if p != parameter]
+        sweep = [r for r in results if all(r[p] == default[p] for p in others)]
+        for stage in sorted(set(r['stage'] for r in sweep)):
+            points = [r for r in sweep if (r['stage'] == stage) and (r['time'] > 0)]
+            if(len(set(r[parameter] for r in points)) < 2):
+                continue
+            log_size = np.log([r[parameter] for r in points])
+            log_time = np.log([r['time'] for r in points])
+            exponents.setdefault(stage, {})[parameter] = np.polyfit(log_size, log_time, 1)[0]
+    return exponents
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Finds the stages that are slower or use more memory than in a baseline.
+
+    Args:
+        baseline (dict): list of dictionaries as returned by run_suite
+        current (dict): list of dictionaries as returned by run_suite
+        threshold (float): allowed fractional increase. Defaults to 0.2.
+    Returns:
+        regressions (dict): list of dictionaries with the keys stage, n_fiber,
+             n_target, n_tiles, quantity ('time' or 'peak_memory'), baseline,
+             current and ratio, for each measurement above the threshold.
+    Note:
+        Raises ValueError if no measurement of current has a counterpart in baseline.
+    """
+    keys = ['stage', 'n_fiber', 'n_target', 'n_tiles']
+    reference = dict((tuple(r[k] for k in keys), r) for r in baseline)
+    regressions = []
+    n_matched = 0
+    for r in current:
+        key = tuple(r[k] for k in keys)
+        if(key not in reference):
+            continue
+        n_matched = n_matched + 1
+        for quantity in ['time', 'peak_memory']:
+            old = reference[key][quantity]
+            new = r[quantity]
+            if((old is None) or (new is None) or (old <= 0)):
+                continue
+            if(new > (1.0 + threshold) * old):
+                regression = dict(zip(keys, key))
+                regression.update({'quantity': quantity, 'baseline': old,
+                                   'current': new, 'ratio': new / float(old)})
+                regressions.append(regression)
+    if((n_matched == 0) and (len(current) > 0)):
+        raise ValueError('None of the benchmarked sizes and stages is present in the baseline')
+    return regressions
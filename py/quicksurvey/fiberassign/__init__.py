@@ -3,4 +3,5 @@ Tools for making fiber assignment onto targets.
 """
 
 import assign
+import reachability
 
@@ -1,4 +1,5 @@
 import numpy as np
+from quicksurvey import util
 
 def find_available_targets(Fibers, TargetsTile):
     """
@@ -51,7 +52,7 @@ def select_target(Fibers, TargetsTile, TargetsSurvey):
         TOWRITE
         - We do not use the information on different kinds of targets
         - We do not use any priority information
-        - We do not check for positioner collision
+        - We do not check for positioner collision, see repair_collisions
         - We do not use information from the rest of the survey.
     """
 
@@ -61,4 +62,122 @@ def select_target(Fibers, TargetsTile, TargetsSurvey):
             target = target_array[0]
             Fibers.set_target(i, target)        
             TargetsTile.set_fiber(target, i)
-    return 
+    return
+
+
+def repair_collisions(Fibers, TargetsTile):
+    """
+    Removes the collisions between neighboring positioners after the 
+    targets have been selected.
+
+    Args:
+         Fibers (FocalPlaneFibers class object): fiber information
+         TargetsTile (TargetTile class object): target information about all the 
+             targets  in a given tile.
+    Returns:
+         [n_moved, n_unassigned]: number of fibers moved to another target and number
+             of fibers left without target to remove a collision.
+         Updates the .target field for each Fiber.
+         Updates the .fiber field for each TargetsTile
+    Note:
+        Each pair of neighboring assigned fibers is checked once. Pairs whose arms
+        and bodies are too far apart to touch are discarded with bounding circles 
+        before the polygon test, and the polygons of each placed fiber are built once.
+        A fiber in collision is moved to the next available target (in order of 
+        increasing distance) that is free and does not collide with any of its 
+        neighbors, or left unassigned if there is none. A move never creates a new 
+        collision, so a single pass over the fibers in collision is enough and no
+        collision is left at the end.
+    """
+    adjacent = Fibers.adjacent
+    target_index = dict(zip(TargetsTile.id, range(TargetsTile.n)))
+    placed = {}
+
+    # select_target can give the same target to more than one fiber
+    holders = {}
+    for i in np.where(Fibers.target != -1)[0]:
+        holders.setdefault(Fibers.target[i], set()).add(i)
+
+    def ferrule(targets):
+        loc = np.array([target_index[t] for t in np.atleast_1d(targets)], dtype=np.int64)
+        return [TargetsTile.x[loc], TargetsTile.y[loc]]
+
+    def polygons(i, target):
+        if((i not in placed) or (placed[i][0] != target)):
+            x, y = ferrule(target)
+            pos = util.positioner.place_on_target(Fibers, i, x[0], y[0])
+            placed[i] = (target, util.positioner.collision_polygons(pos))
+        return placed[i][1]
+
+    def collides(i, target):
+        neighbors = np.array([j for j in adjacent[i] if Fibers.target[j] != -1], dtype=np.int64)
+        if(np.size(neighbors)==0):
+            return False
+        x, y = ferrule(target)
+        circles_i = util.positioner.collision_circles(Fibers, [i], x, y)
+        x, y = ferrule(Fibers.target[neighbors])
+        circles_j = util.positioner.collision_circles(Fibers, neighbors, x, y)
+        near = util.positioner.may_collide(np.repeat(circles_i, np.size(neighbors), axis=0), circles_j)
+        for j in neighbors[near]:
+            if(any(util.positioner.find_polygon_collision_type(polygons(i, target), 
+                                                               polygons(j, Fibers.target[j])))):
+                return True
+        return False
+
+    # finds the fibers in collision, testing each pair of neighbors once
+    assigned = np.where(Fibers.target != -1)[0]
+    if(np.size(assigned)==0):
+        return [0, 0]
+    circles = np.zeros((Fibers.n_fiber, 3, 3))
+    x, y = ferrule(Fibers.target[assigned])
+    circles[assigned] = util.positioner.collision_circles(Fibers, assigned, x, y)
+    pair_i = np.repeat(np.arange(Fibers.n_fiber), np.shape(Fibers.neighbors)[1])
+    pair_j = Fibers.neighbors.ravel()
+    pair_key = np.unique(np.minimum(pair_i, pair_j) * Fibers.n_fiber + np.maximum(pair_i, pair_j))
+    pair_i = pair_key // Fibers.n_fiber
+    pair_j = pair_key % Fibers.n_fiber
+    both = (Fibers.target[pair_i] != -1) & (Fibers.target[pair_j] != -1)
+    pair_i = pair_i[both]
+    pair_j = pair_j[both]
+    near = util.positioner.may_collide(circles[pair_i], circles[pair_j])
+
+    in_collision = set()
+    for i, j in zip(pair_i[near], pair_j[near]):
+        if(any(util.positioner.find_polygon_collision_type(polygons(i, Fibers.target[i]),
+                                                           polygons(j, Fibers.target[j])))):
+            in_collision.add(i)
+            in_collision.add(j)
+
+    n_moved = 0
+    n_unassigned = 0
+    for i in sorted(in_collision):
+        # the collision may already be gone if the other fiber was moved
+        target = Fibers.target[i]
+        if((target == -1) or (not collides(i, target))):
+            continue
+
+        # only targets further away than the current one are tried, so a fiber never goes back
+        candidates = Fibers.available_targets[i]
+        start = np.where(candidates == target)[0][0] + 1
+        new_target = -1
+        for candidate in candidates[start:]:
+            if((candidate not in holders) and (not collides(i, candidate))):
+                new_target = candidate
+                break
+
+        # the target stays observed if another fiber still holds it
+        holders[target].discard(i)
+        if(len(holders[target])>0):
+            TargetsTile.set_fiber(target, min(holders[target]))
+        else:
+            del holders[target]
+            TargetsTile.reset_fiber(target)
+        if(new_target != -1):
+            holders[new_target] = set([i])
+            Fibers.set_target(i, new_target)
+            TargetsTile.set_fiber(new_target, i)
+            n_moved = n_moved + 1
+        else:
+            Fibers.reset_target(i)
+            n_unassigned = n_unassigned + 1
+    return [n_moved, n_unassigned]
@@ -0,0 +1,261 @@
+"""
+Fiber-target reachability of a tile, computed once and reused on repeat visits.
+"""
+
+import os
+import hashlib
+import collections
+import numpy as np
+
+def reachability_fingerprint(Fibers, TargetsTile):
+    """
+    Returns a hash of the geometry a reachability graph depends on.
+
+    Args:
+        Fibers (FocalPlaneFibers class object): fiber information
+        TargetsTile (TargetTile class object): target information about all the
+             targets  in a given tile.
+    Returns:
+        fingerprint (string): hexadecimal digest of the fiber positions, the patrol
+             radius and the IDs and focal plane positions of the targets.
+    """
+    digest = hashlib.sha1()
+    patrol_radius = Fibers.positioner.R1 + Fibers.positioner.R2
+    for array in [Fibers.x_focal, Fibers.y_focal, [patrol_radius], TargetsTile.x, TargetsTile.y]:
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(TargetsTile.id, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+class ReachabilityGraph(object):
+    """
+    Keeps, for each fiber, the targets of a tile within its patrol radius,
+    in compressed sparse row format.
+
+    Attributes:
+        The properties initialized in the __init__ procedure:
+        tile_id (int): ID identifying the tile
+        n_fiber (int): number of fibers
+        n_target (int): number of targets in the tile
+        offsets (int): 1D array of size n_fiber+1, the targets of fiber i are
+             stored between offsets[i] and offsets[i+1]
+        indices (int): 1D array, positions of the reachable targets in the tile arrays,
+             sorted by increasing distance for each fiber
+        distances (float): 1D array, distance from the fiber to each reachable target, in mm
+        fingerprint (string): hash of the geometry the graph was computed from,
+             see reachability_fingerprint
+    """
+    def __init__(self, tile_id, n_fiber, n_target, offsets, indices, distances, fingerprint):
+        self.tile_id = tile_id
+        self.fingerprint = fingerprint
+        self.n_fiber = n_fiber
+        self.n_target = n_target
+        self.offsets = offsets
+        self.indices = indices
+        self.distances = distances
+
+    def nbytes(self):
+        """
+        Returns the memory used by the arrays of the graph, in bytes.
+        """
+        return self.offsets.nbytes + self.indices.nbytes + self.distances.nbytes
+
+    def apply(self, Fibers, TargetsTile, mask=None):
+        """
+        Sets the available targets of each fiber from the graph.
+
+        Args:
+            Fibers (FocalPlaneFibers class object): fiber information
+            TargetsTile (TargetTile class object): target information about all the
+                 targets  in the tile the graph was computed for.
+            mask (bool): optional 1D array over the targets of the tile, False for
+                 the targets that are done or removed and must not be offered.
+        Returns:
+             Updates the .available_targets and .n_targets fields for each Fiber.
+        """
+        if((Fibers.n_fiber != self.n_fiber) or (TargetsTile.n != self.n_target)):
+            raise ValueError('The reachability of tile %d was computed for %d fibers and %d targets, got %d and %d'%(
+                    self.tile_id, self.n_fiber, self.n_target, Fibers.n_fiber, TargetsTile.n))
+        for i in range(Fibers.n_fiber):
+            reachable = self.indices[self.offsets[i]:self.offsets[i+1]]
+            if(mask is not None):
+                reachable = reachable[mask[reachable]]
+            if(np.size(reachable)>0):
+                Fibers.set_available(i, TargetsTile.id[reachable])
+            else:
+                Fibers.reset_available(i)
+
+    def save(self, filename):
+        """
+        Writes the graph to a .npz file.
+
+        Args:
+            filename (string): name of the output file
+        """
+        np.savez(filename, tile_id=self.tile_id, n_fiber=self.n_fiber, n_target=self.n_target,
+                 offsets=self.offsets, indices=self.indices, distances=self.distances,
+                 fingerprint=self.fingerprint)
+
+def load_reachability(filename):
+    """
+    Reads a graph written by ReachabilityGraph.save.
+
+    Args:
+        filename (string): name of the .npz file
+    Returns:
+        ReachabilityGraph class object
+    Note:
+        Files written without a fingerprint get an empty one, so they never match.
+    """
+    with np.load(filename) as data:
+        if('fingerprint' in data.files):
+            fingerprint = str(data['fingerprint'])
+        else:
+            fingerprint = ''
+        return ReachabilityGraph(int(data['tile_id']), int(data['n_fiber']), int(data['n_target']),
+                                 data['offsets'], data['indices'], data['distances'], fingerprint)
+
+def compute_reachability(Fibers, TargetsTile):
+    """
+    Finds the targets of a tile within the patrol radius of each fiber.
+
+    Args:
+        Fibers (FocalPlaneFibers class object): fiber information
+        TargetsTile (TargetTile class object): target information about all the
+             targets  in a given tile.
+    Returns:
+        ReachabilityGraph class object
+    Note:
+        The targets of each fiber are in the same order as in find_available_targets.
+    """
+    patrol_radius = Fibers.positioner.R1 + Fibers.positioner.R2
+    offsets = np.zeros(Fibers.n_fiber + 1, dtype=np.int64)
+    indices = []
+    distances = []
+    for i in range(Fibers.n_fiber):
+        distance = np.sqrt((TargetsTile.x - Fibers.x_focal[i])**2 + (TargetsTile.y - Fibers.y_focal[i])**2)
+        reachable = np.where(distance < patrol_radius)[0]
+        reachable = reachable[distance[reachable].argsort()]
+        indices.append(reachable)
+        distances.append(distance[reachable])
+        offsets[i+1] = offsets[i] + np.size(reachable)
+    return ReachabilityGraph(TargetsTile.tile_id, Fibers.n_fiber, TargetsTile.n, offsets,
+                             np.concatenate(indices), np.concatenate(distances),
+                             reachability_fingerprint(Fibers, TargetsTile))
+
+class ReachabilityCache(object):
+    """
+    Keeps the reachability graphs of the most recently used tiles, identified by
+    their TILE_ID, up to a maximum size.
+
+    Attributes:
+        The properties initialized in the __init__ procedure:
+        directory (string): directory where the graphs are persisted, None to keep
+             them only in memory
+        max_bytes (int): maximum memory used by the graphs kept in memory, in bytes
+        n_bytes (int): memory currently used by the graphs kept in memory, in bytes
+        hits (int): number of graphs reused
+        misses (int): number of graphs computed
+        evictions (int): number of graphs removed from memory to make space
+    Note:
+        A graph evicted from memory is read again from the directory, if there is
+        one, or computed again on the next visit of its tile.
+    """
+    def __init__(self, directory=None, max_bytes=1024**3):
+        """
+        Args:
+            directory (string): optional directory where the graphs are written,
+                so that they can be reused by later runs. It is created if it does
+                not exist. Defaults to None.
+            max_bytes (int): maximum memory used by the graphs kept in memory, in bytes.
+                Defaults to 1 GB.
+        """
+        if((directory is not None) and (not os.path.isdir(directory))):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._graphs = collections.OrderedDict()
+
+    def filename(self, tile_id):
+        """
+        Returns the name of the file holding the graph of a tile.
+        """
+        return os.path.join(self.directory, 'Reachability_Tile_%d.npz'%(tile_id))
+
+    def get(self, Fibers, TargetsTile):
+        """
+        Returns the reachability graph of a tile, computing it only on the first visit.
+
+        Args:
+            Fibers (FocalPlaneFibers class object): fiber information
+            TargetsTile (TargetTile class object): target information about all the
+                 targets  in a given tile.
+        Returns:
+            ReachabilityGraph class object
+        Note:
+            A cached graph whose fingerprint does not match the current fibers
+            and targets (moved fibers, regenerated tile) is computed again.
+            A graph larger than max_bytes is returned but not kept in memory.
+        """
+        tile_id = TargetsTile.tile_id
+        fingerprint = reachability_fingerprint(Fibers, TargetsTile)
+        graph = self._graphs.pop(tile_id, None)
+        if(graph is not None):
+            self.n_bytes = self.n_bytes - graph.nbytes()
+        elif((self.directory is not None) and os.path.isfile(self.filename(tile_id))):
+            graph = load_reachability(self.filename(tile_id))
+        if((graph is not None) and (graph.fingerprint == fingerprint)):
+            self.hits = self.hits + 1
+        else:
+            self.misses = self.misses + 1
+            graph = compute_reachability(Fibers, TargetsTile)
+            if(self.directory is not None):
+                graph.save(self.filename(tile_id))
+
+        # the graph goes to the most recently used end
+        size = graph.nbytes()
+        if(size <= self.max_bytes):
+            while(self.n_bytes + size > self.max_bytes):
+                oldest, oldest_graph = self._graphs.popitem(last=False)
+                self.n_bytes = self.n_bytes - oldest_graph.nbytes()
+                self.evictions = self.evictions + 1
+            self._graphs[tile_id] = graph
+            self.n_bytes = self.n_bytes + size
+        return graph
+
+    def clear(self):
+        """
+        Removes all the graphs from memory. The statistics and the files are kept.
+        """
+        self._graphs.clear()
+        self.n_bytes = 0
+
+    def stats(self):
+        """
+        Returns the usage statistics of the cache.
+
+        Returns:
+            stats (dict): with the keys 'hits', 'misses', 'evictions', 'n_tiles',
+                 'n_bytes' and 'max_bytes'.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'n_tiles': len(self._graphs), 'n_bytes': self.n_bytes,
+                'max_bytes': self.max_bytes}
+
+    def find_available_targets(self, Fibers, TargetsTile, mask=None):
+        """
+        Same as assign.find_available_targets, reusing the graph of the tile on repeat visits.
+
+        Args:
+            Fibers (FocalPlaneFibers class object): fiber information
+            TargetsTile (TargetTile class object): target information about all the
+                 targets  in a given tile.
+            mask (bool): optional 1D array over the targets of the tile, False for
+                 the targets that are done or removed.
+        Returns:
+             Updates the .available_targets and .n_targets fields for each Fiber.
+        """
+        self.get(Fibers, TargetsTile).apply(Fibers, TargetsTile, mask=mask)
@@ -2,6 +2,7 @@
 Tools to mock an observation run, that means taking the list of desired tiles and putting fibers on targets.
 """
 
-
+import ensemble
+import stream
 
 
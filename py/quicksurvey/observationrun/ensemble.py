@@ -0,0 +1,143 @@
+"""
+Runs a Monte Carlo ensemble of survey realizations.
+
+The read-only inputs (focal plane, target tiles and the survey-wide target list)
+are loaded once. Each realization only owns a small array with the number of
+times each target has been observed.
+"""
+
+import multiprocessing
+import numpy as np
+from quicksurvey import util
+from quicksurvey import fiberassign
+
+# Read-only state inherited by the worker processes after the fork.
+_SHARED = {}
+
+def random_subset(n_visits):
+    """
+    Returns a strategy that observes a random subset of the tiles.
+
+    Args:
+        n_visits (int): number of tiles observed in each realization, for instance
+             the number of days times the maximum number of tiles per day.
+    Returns:
+        strategy (function): called as strategy(rng, ensemble), returns the indices
+             of n_visits distinct tiles drawn at random, in random order.
+    Note:
+        If n_visits is not smaller than the number of tiles every tile is observed,
+        and the realizations only differ through the order of the visits, which
+        has an effect only with skip_observed (see SurveyEnsemble.run_realization).
+    """
+    def strategy(rng, ensemble):
+        return rng.permutation(ensemble.n_tiles)[:n_visits]
+    return strategy
+
+class SurveyEnsemble(object):
+    """
+    Keeps the read-only inputs shared by all the realizations of a survey.
+
+    Attributes:
+        The properties initialized in the __init__ procedure:
+        fibers (FocalPlaneFibers class object): fiber information
+        tiles (TargetTile class object): list with the targets of each tile
+        targets (TargetSurvey class object): information for all targets
+        tile_index (int): list of 1D arrays, for each tile the location of its
+             targets in the TargetSurvey arrays.
+        reachability (ReachabilityGraph class object): list with the fiber-target
+             graph of each tile, computed once for all realizations.
+        n_tiles (int): number of tiles
+    """
+    def __init__(self, fiber_file, tile_filename_list):
+        """
+        Args:
+            fiber_file (string): FITS file with the fiber positions
+            tile_filename_list (string): 1D array of filenames with tile by tile target information.
+        """
+        self.fibers = util.FocalPlaneFibers(fiber_file)
+        self.tiles = [util.TargetTile(tile_file) for tile_file in tile_filename_list]
+        self.targets = util.TargetSurvey(tile_filename_list, tile_list=self.tiles)
+        self.tile_index = [self.targets.index_of(tile.id) for tile in self.tiles]
+        self.reachability = [fiberassign.reachability.compute_reachability(self.fibers, tile) 
+                             for tile in self.tiles]
+        self.n_tiles = len(self.tiles)
+
+    def run_realization(self, seed, strategy, skip_observed=False):
+        """
+        Runs a single realization of the survey.
+
+        Args:
+            seed (int): seed for the random generator of this realization
+            strategy (function): called as strategy(rng, ensemble), returns the
+                 indices of the tiles to be observed, in order.
+            skip_observed (bool): if True, the targets already observed in this
+                 realization are not offered again. Defaults to False.
+        Returns:
+            n_observed (int): 1D array with the number of times each target in
+                 self.targets has been observed.
+        Note:
+            Only the scratch fields of the fibers and tiles (available targets,
+            assigned target, assigned fiber) are modified, and they are reset
+            before each tile. The TargetSurvey arrays are never modified.
+        """
+        rng = np.random.RandomState(seed)
+        n_observed = np.zeros(self.targets.n_targets, dtype='i4')
+        for i_tile in strategy(rng, self):
+            tile = self.tiles[i_tile]
+            self.fibers.reset_all_available()
+            self.fibers.reset_all_targets()
+            tile.reset_all_fibers()
+
+            if(skip_observed):
+                needed = n_observed[self.tile_index[i_tile]] == 0
+            else:
+                needed = None
+            self.reachability[i_tile].apply(self.fibers, tile, mask=needed)
+            fiberassign.assign.select_target(self.fibers, tile, self.targets)
+            fiberassign.assign.repair_collisions(self.fibers, tile)
+
+            assigned = self.tile_index[i_tile][tile.fiber != -1]
+            n_observed[assigned] = n_observed[assigned] + 1
+        return n_observed
+
+    def run(self, seeds, strategy, n_proc=1, skip_observed=False):
+        """
+        Runs one realization of the survey for each seed.
+
+        Args:
+            seeds (int): 1D array of seeds, one per realization
+            strategy (function): see run_realization
+            n_proc (int): number of processes. Defaults to 1.
+            skip_observed (bool): see run_realization. Defaults to False.
+        Returns:
+            n_observed (int): 2D array of shape (n_realizations, n_targets)
+        Note:
+            With n_proc>1 the worker processes are forked after the inputs are
+            loaded, so they share the input arrays copy-on-write.
+        """
+        if(n_proc<=1):
+            results = [self.run_realization(seed, strategy, skip_observed=skip_observed)
+                       for seed in seeds]
+        else:
+            _SHARED['ensemble'] = self
+            _SHARED['strategy'] = strategy
+            _SHARED['skip_observed'] = skip_observed
+            if(hasattr(multiprocessing, 'get_context')):
+                context = multiprocessing.get_context('fork')
+            else:
+                context = multiprocessing
+            pool = context.Pool(n_proc)
+            try:
+                results = pool.map(_run_shared_realization, list(seeds))
+            finally:
+                pool.close()
+                pool.join()
+                _SHARED.clear()
+        return np.array(results)
+
+def _run_shared_realization(seed):
+    """
+    Runs a realization on the ensemble inherited from the parent process.
+    """
+    return _SHARED['ensemble'].run_realization(seed, _SHARED['strategy'],
+                                               skip_observed=_SHARED['skip_observed'])
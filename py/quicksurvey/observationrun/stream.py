@@ -0,0 +1,126 @@
+"""
+Streaming stages to overlap reading tiles with the fiber assignment.
+
+Each stage is a generator that runs its work in background threads and
+hands over the results in order through a bounded queue. A stage never
+holds more than 'depth' items ahead of its consumer.
+"""
+
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from quicksurvey import util
+
+# Marks the end of a stream.
+_DONE = object()
+
+def _put(q, item, stop):
+    """
+    Puts an item in a bounded queue, waiting for space unless the stream is stopped.
+    Returns True if the item was put in the queue.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def map_stage(function, iterable, depth=2, n_workers=1):
+    """
+    Applies a function to each item of an iterable in background threads.
+
+    Args:
+        function (function): called on each item of the iterable
+        iterable: the input items, consumed in a background thread
+        depth (int): maximum number of items read ahead of the consumer. Defaults to 2.
+        n_workers (int): number of threads applying the function. Defaults to 1.
+    Returns:
+        Generator over function(item), in the same order as the input items.
+    Note:
+        An exception raised by the function or by the iterable is raised again
+        in the consumer when it reaches the corresponding item.
+    """
+    if(depth<1):
+        raise ValueError('The depth of a stage must be at least 1, got %d'%(depth))
+    if(n_workers<1):
+        raise ValueError('A stage needs at least one worker, got %d'%(n_workers))
+
+    work = queue.Queue()
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def feed():
+        try:
+            for item in iterable:
+                slot = queue.Queue(maxsize=1)
+                if(not _put(pending, slot, stop)):
+                    return
+                work.put((item, slot))
+        except Exception as err:
+            slot = queue.Queue(maxsize=1)
+            slot.put((False, err))
+            _put(pending, slot, stop)
+        finally:
+            _put(pending, _DONE, stop)
+            for i in range(n_workers):
+                work.put(_DONE)
+
+    def apply():
+        while True:
+            task = work.get()
+            if(task is _DONE):
+                return
+            item, slot = task
+            try:
+                slot.put((True, function(item)))
+            except Exception as err:
+                slot.put((False, err))
+
+    threads = [threading.Thread(target=feed)]
+    threads += [threading.Thread(target=apply) for i in range(n_workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while True:
+            slot = pending.get()
+            if(slot is _DONE):
+                return
+            success, value = slot.get()
+            if(not success):
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+def prefetch(iterable, depth=2):
+    """
+    Consumes an iterable in a background thread, keeping up to 'depth' items ready.
+
+    Args:
+        iterable: the input items
+        depth (int): maximum number of items read ahead of the consumer. Defaults to 2.
+    Returns:
+        Generator over the items of the iterable, in order.
+    """
+    return map_stage(lambda item: item, iterable, depth=depth, n_workers=1)
+
+def load_tiles(tile_filename_list, depth=2, n_workers=1, cache=None):
+    """
+    Reads and projects the targets of each tile ahead of their use.
+
+    Args:
+        tile_filename_list (string): 1D array of filenames with tile by tile target information.
+        depth (int): maximum number of tiles loaded ahead of the consumer. Defaults to 2.
+        n_workers (int): number of threads reading tiles. Defaults to 1.
+        cache (TileCache class object): optional cache of decoded tiles.
+    Returns:
+        Generator over the TargetTile objects, in the same order as tile_filename_list.
+    """
+    return map_stage(lambda tile_file: util.TargetTile(tile_file, cache=cache), 
+                     tile_filename_list, depth=depth, n_workers=n_workers)
@@ -2,5 +2,6 @@
 Tools to update the observed targets database/files once we know their redshift.
 """
 from update import *
+from completeness import *
 
 
@@ -0,0 +1,136 @@
+"""
+Sky maps of the survey completeness, updated tile by tile.
+"""
+
+import numpy as np
+
+class CompletenessMap(object):
+    """
+    Counts, for each sky bin and target type, how many targets exist and how many
+    have been observed at least once.
+
+    Attributes:
+        The properties initialized in the __init__ procedure:
+        types (string): array with the target types, sorted
+        n_bins (int): number of sky bins
+        n_total (int): 2D array of shape (n_types, n_bins) with the number of targets
+        n_done (int): 2D array of shape (n_types, n_bins) with the number of targets
+             observed at least once
+        n_ra (int): number of bins in RA, for the RA/dec grid
+        n_dec (int): number of bins in dec, for the RA/dec grid
+        nside (int): HEALPix resolution, None for the RA/dec grid
+    """
+    def __init__(self, all_targets, n_ra=360, n_dec=180, nside=None):
+        """
+        Args:
+            all_targets (TargetSurvey class object): object summarizing the information for all targets
+            n_ra (int): number of bins in RA. Defaults to 360.
+            n_dec (int): number of bins in dec. Defaults to 180.
+            nside (int): if given, HEALPix pixels of this resolution are used instead
+                of the RA/dec grid. Requires healpy.
+        Note:
+            This is the only pass over all the targets. Targets already observed
+            are counted as done.
+        """
+        self.n_ra = n_ra
+        self.n_dec = n_dec
+        self.nside = nside
+        if(nside is None):
+            self.n_bins = n_ra * n_dec
+        else:
+            import healpy
+            self.n_bins = healpy.nside2npix(nside)
+
+        self.types = np.unique(all_targets.type)
+        self.n_total = np.zeros((np.size(self.types), self.n_bins), dtype=np.int64)
+        self.n_done = np.zeros((np.size(self.types), self.n_bins), dtype=np.int64)
+
+        type_index = self.type_index(all_targets.type)
+        bins = self.sky_bin(all_targets.ra, all_targets.dec)
+        np.add.at(self.n_total, (type_index, bins), 1)
+        observed = all_targets.n_observed > 0
+        np.add.at(self.n_done, (type_index[observed], bins[observed]), 1)
+
+    def sky_bin(self, ra, dec):
+        """
+        Returns the sky bin of each position.
+
+        Args:
+            ra (float): 1D array, RA coordinates (degrees)
+            dec (float): 1D array, dec coordinates (degrees)
+        Returns:
+            bins (int): 1D array with the bin of each position
+        """
+        if(self.nside is None):
+            i_ra = np.int_(np.mod(ra, 360.0) * self.n_ra / 360.0)
+            i_dec = np.int_((np.asarray(dec) + 90.0) * self.n_dec / 180.0)
+            i_ra = np.clip(i_ra, 0, self.n_ra - 1)
+            i_dec = np.clip(i_dec, 0, self.n_dec - 1)
+            return i_dec * self.n_ra + i_ra
+        else:
+            import healpy
+            return healpy.ang2pix(self.nside, ra, dec, lonlat=True)
+
+    def type_index(self, target_type):
+        """
+        Returns the position of each target type in self.types.
+
+        Args:
+            target_type (string): 1D array of target types
+        Returns:
+            index (int): 1D array with the locations of target_type in self.types
+        """
+        index = np.searchsorted(self.types, target_type)
+        index = np.clip(index, 0, np.size(self.types) - 1)
+        if(np.any(self.types[index] != target_type)):
+            raise ValueError('Target type not present when the completeness map was built')
+        return index
+
+    def update(self, all_targets, tile_targets):
+        """
+        Counts the targets of a tile that have been observed for the first time.
+
+        Args:
+            all_targets (TargetSurvey class object): object summarizing the information for all targets
+            tile_targets (TargetTile class object): object summarizing the information for targets on a given tile.
+        Note:
+            Has to be called after recordresults.update.update_global_targets for
+            the same tile. Only the targets assigned to a fiber are looked up,
+            so the cost does not depend on the total number of targets.
+        """
+        assigned = np.where(tile_targets.fiber != -1)[0]
+        if(np.size(assigned)==0):
+            return
+        index = all_targets.index_of(tile_targets.id[assigned])
+        new = assigned[all_targets.n_observed[index] == 1]
+
+        type_index = self.type_index(tile_targets.type[new])
+        bins = self.sky_bin(tile_targets.ra[new], tile_targets.dec[new])
+        np.add.at(self.n_done, (type_index, bins), 1)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current state of the map.
+
+        Returns:
+            snapshot (dict): with the keys 'types', 'n_total', 'n_done' and
+                 'completeness', the fraction of targets observed in each
+                 (type, bin), set to zero in empty bins.
+        """
+        n_total = self.n_total.copy()
+        n_done = self.n_done.copy()
+        completeness = np.zeros(np.shape(n_total))
+        filled = n_total > 0
+        completeness[filled] = n_done[filled] / np.float64(n_total[filled])
+        return {'types': self.types.copy(), 'n_total': n_total,
+                'n_done': n_done, 'completeness': completeness}
+
+    def completeness_by_type(self):
+        """
+        Returns the fraction of targets of each type observed at least once.
+
+        Returns:
+            completeness (float): 1D array, in the same order as self.types
+        """
+        n_total = self.n_total.sum(axis=1)
+        return self.n_done.sum(axis=1) / np.float64(np.maximum(n_total, 1))
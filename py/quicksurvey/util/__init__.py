@@ -6,6 +6,7 @@ Tools for setting up the survey
 import configuration
 import inout
 import positioner
+import tilecache
 from astropy.io import fits
 import numpy as np
 import shapely as shape
@@ -221,6 +222,8 @@ class FocalPlaneFibers(object):
         positioner_id (int) : 
         spectrograph_id (int) : 
         neighbors (int) : 2D array of shape (n_fibers, 6) holding the fiber of the 6 nearest fibers.
+        adjacent (int) : list of sets, for each fiber its neighbors and the fibers that have it
+             as a neighbor, i.e. all the fibers it can collide with.
         n_fiber (int) : total number of fibers
     """
 
@@ -242,6 +245,11 @@ class FocalPlaneFibers(object):
             radius = np.sqrt((self.x_focal -x )** 2 + (self.y_focal - y)**2)
             ids = radius.argsort()
             self.neighbors[i,:] = ids[1:7]
+
+        self.adjacent = [set(self.neighbors[i]) for i in range(self.n_fiber)]
+        for i in range(self.n_fiber):
+            for j in self.neighbors[i]:
+                self.adjacent[j].add(i)
         
 
         # This section is related to targets
@@ -262,7 +270,7 @@ class FocalPlaneFibers(object):
              
         """
         self.available_targets[position] = ID_list.copy()
-        self.n_targets[position] = np.size(self.available_targets)
+        self.n_targets[position] = np.size(self.available_targets[position])
 
     def reset_available(self, position):
         """
@@ -327,19 +335,28 @@ class TargetTile(object):
          y (float): array of positions on the focal plane, in mm
          fiber_id (int): array of fiber_id to which the target is assigned
     """
-    def __init__(self, filename):
-
-        hdulist = fits.open(filename)        
+    def __init__(self, filename, cache=None):
+        """
+        Args:
+            filename (string): name of the Targets_Tile FITS file
+            cache (TileCache class object): optional cache of decoded tiles. If given,
+                the file is only read when the tile is not in the cache.
+        """
+        if(cache is None):
+            tile_data = tilecache.read_tile(filename)
+        else:
+            tile_data = cache.get(filename)
         self.filename = filename
-        self.ra = hdulist[1].data['RA']
-        self.dec = hdulist[1].data['DEC']
-        self.type = hdulist[1].data['OBJTYPE']
-        self.id = np.int_(hdulist[1].data['TARGETID'])
-        self.tile_ra = hdulist[1].header['TILE_RA']
-        self.tile_dec = hdulist[1].header['TILE_DEC']
-        self.tile_id = hdulist[1].header['TILE_ID']
+        self.ra = tile_data['ra']
+        self.dec = tile_data['dec']
+        self.type = tile_data['type']
+        self.id = tile_data['id']
+        self.tile_ra = tile_data['tile_ra']
+        self.tile_dec = tile_data['tile_dec']
+        self.tile_id = tile_data['tile_id']
         self.n = np.size(self.ra)
-        self.x, self.y = radec2xy(self.ra, self.dec, self.tile_ra, self.tile_dec)
+        self.x = tile_data['x']
+        self.y = tile_data['y']
 
         # this is related to the fiber assignment 
         self.fiber = -1.0 * np.ones(self.n, dtype='i4')
@@ -471,6 +488,8 @@ class TargetSurvey(object):
     Keeps basic information for all the targets in all tiles.
     Attributes: 
         The properties initialized in the __init__ procedure are:
+        ra (float): array for the target's RA
+        dec (float): array for the target's dec
         type (string): array describing the type of target.
         id (int): 1D array of unique IDs.
         n_observed (int)
@@ -478,13 +497,28 @@ class TargetSurvey(object):
         assigned_z (float): number of times this target has been observed
         tile_names (string): list of list keeping track of all the tiles where this target is present.
     """
-    def __init__(self, filename_list):
+    def __init__(self, filename_list, tile_list=None, cache=None):
+        """
+        Args:
+            filename_list (string): 1D array of filenames with tile by tile target information.
+            tile_list (TargetTile class object): optional list of tiles already loaded 
+                from filename_list, in the same order. If given, the files are not read again.
+            cache (TileCache class object): optional cache of decoded tiles, used 
+                when tile_list is not given.
+        """
         n_file = np.size(filename_list)
+        if((tile_list is not None) and (len(tile_list)!=n_file)):
+            raise ValueError('Building TargetSurvey the number of tiles is not the same as the number of files.')
         for i_file in np.arange(n_file):
             print('Adding %s to build TargetSurvey %d files to go'%(filename_list[i_file], n_file - i_file))
-            tmp = TargetTile(filename_list[i_file])
+            if(tile_list is None):
+                tmp = TargetTile(filename_list[i_file], cache=cache)
+            else:
+                tmp = tile_list[i_file]
             # The first file is a simple initialization
             if(i_file==0):
+                self.ra = tmp.ra.copy()
+                self.dec = tmp.dec.copy()
                 self.type = tmp.type.copy()
                 self.id = tmp.id.copy()
                 self.n_observed = tmp.n_observed.copy()
@@ -505,6 +539,8 @@ class TargetSurvey(object):
                 mask = np.in1d(tmp.id, self.id, invert=True)
                 n_new = np.size(np.where(mask==True))
                 self.id = np.append(self.id, tmp.id[mask])
+                self.ra = np.append(self.ra, tmp.ra[mask])
+                self.dec = np.append(self.dec, tmp.dec[mask])
                 self.type = np.append(self.type, tmp.type[mask])
                 self.n_observed = np.append(self.n_observed, tmp.n_observed[mask])
                 self.assigned_type = np.append(self.assigned_type, tmp.assigned_type[mask])
@@ -513,3 +549,25 @@ class TargetSurvey(object):
                     self.tile_names.append([filename_list[i_file]])
 
         self.n_targets = np.size(self.id)
+        self._id_sorter = self.id.argsort()
+
+    def index_of(self, target_ids):
+        """
+        Returns the position in the survey arrays of each of the given target IDs.
+
+        Args:
+            target_ids (int): 1D array of target IDs expected to be in self.id
+        Returns:
+            index (int): 1D array with the locations of target_ids in self.id
+        Note:
+            Uses a sorted search, so the cost is O(n log N) for n IDs instead of 
+            scanning the N survey targets once per ID.
+        """
+        target_ids = np.atleast_1d(target_ids)
+        loc = np.searchsorted(self.id, target_ids, sorter=self._id_sorter)
+        loc = np.clip(loc, 0, self.n_targets - 1)
+        index = self._id_sorter[loc]
+        missing = self.id[index] != target_ids
+        if(np.any(missing)):
+            raise ValueError('The target id %d was not found in general target list'%(target_ids[missing][0]))
+        return index
@@ -1,25 +1,134 @@
+import numpy as np
+import shapely.geometry as shapeg
 import quicksurvey
 
-def find_collision_type(pos_A, pos_B):
+def target_angles(fibers, position, x, y):
     """
-    Checks for Type II and Type III collisions between positioners.
-    
+    Returns the angles of the arms of a fiber with its ferrule on a given point.
+
     Args:
-        pos_A (object Positioner): object defining positioner A
-        pos_B (object Positioner): object defining positioner B
-    
+        fibers (FocalPlaneFibers class object): fiber information
+        position (int): position of the fiber in the list
+        x (float): x position of the target on the focal plane, in mm
+        y (float): y position of the target on the focal plane, in mm
     Returns:
-       [True/False, True/True/False]: according 
-            if TypeII, TypeIII are True/False, respectively
+        [theta, phi]: angles of the inner and outer arm, in radians.
+    Note:
+        Points beyond the patrol radius are reached as close as possible.
     """
-    upper_A_poly  = shapeg.Polygon(pos_A.upper_pos)
-    central_A_poly  = shapeg.Polygon(pos_A.central_pos)
-    lower_A_poly  = shapeg.Polygon(pos_A.lower_pos)
-    
-    upper_B_poly  = shapeg.Polygon(pos_B.upper_pos)
-    central_B_poly  = shapeg.Polygon(pos_B.central_pos)
-    lower_B_poly  = shapeg.Polygon(pos_B.lower_pos)
-    
+    R1 = fibers.positioner.R1
+    R2 = fibers.positioner.R2
+    dx = x - fibers.x_focal[position]
+    dy = y - fibers.y_focal[position]
+    distance_sq = dx*dx + dy*dy
+    cos_phi = np.clip((distance_sq - R1*R1 - R2*R2)/(2.0*R1*R2), -1.0, 1.0)
+    phi = np.arccos(cos_phi)
+    theta = np.arctan2(dy, dx) - np.arctan2(R2*np.sin(phi), R1 + R2*cos_phi)
+    return [theta, phi]
+
+def place_on_target(fibers, position, x, y):
+    """
+    Returns the positioner of a fiber with its ferrule moved onto a given point.
+
+    Args:
+        fibers (FocalPlaneFibers class object): fiber information
+        position (int): position of the fiber in the list
+        x (float): x position of the target on the focal plane, in mm
+        y (float): y position of the target on the focal plane, in mm
+    Returns:
+        Positioner class object centered on the fiber, with the Theta and Phi 
+        angles that put the ferrule on (x,y).
+    Note:
+        Points beyond the patrol radius are reached as close as possible.
+    """
+    theta, phi = target_angles(fibers, position, x, y)
+    return quicksurvey.util.Positioner(offset_x=fibers.x_focal[position], 
+                                       offset_y=fibers.y_focal[position],
+                                       Theta=np.rad2deg(theta), Phi=np.rad2deg(phi),
+                                       id=fibers.positioner_id[position])
+
+def _bounding_circle(points):
+    """
+    Returns [x, y, radius] of a circle containing all the points of a 2D array.
+    """
+    center = 0.5 * (points.min(axis=0) + points.max(axis=0))
+    radius = np.max(np.sqrt(np.sum((points - center)**2, axis=1)))
+    return [center[0], center[1], radius]
+
+def collision_circles(fibers, positions, x, y):
+    """
+    Returns circles containing the parts of positioners involved in collisions,
+    without building the Positioner objects.
+
+    Args:
+        fibers (FocalPlaneFibers class object): fiber information
+        positions (int): 1D array, positions of the fibers in the list
+        x (float): 1D array, x position of each ferrule on the focal plane, in mm
+        y (float): 1D array, y position of each ferrule on the focal plane, in mm
+    Returns:
+       circles (float): array of shape (n, 3, 3), for each fiber the [x, y, radius]
+            of the circles around the upper arm, the central body and the lower arm, in mm.
+    Note:
+        The arms are rigid in the frame of the ferrule oriented along the outer arm,
+        and the central body in the frame of the central axis rotated by theta, so
+        the circles are computed in those frames on fibers.positioner 
+        (at Theta=0, Phi=0 and no offset) and then moved.
+    """
+    positions = np.atleast_1d(positions)
+    x = np.atleast_1d(x)
+    y = np.atleast_1d(y)
+    pos = fibers.positioner
+    ferrule = np.array([pos.R1 + pos.R2, 0.0])
+    reference = [_bounding_circle(pos.upper_pos - ferrule), _bounding_circle(pos.central_pos),
+                 _bounding_circle(pos.lower_pos - ferrule)]
+    theta, phi = target_angles(fibers, positions, x, y)
+    origins = [[x, y, theta + phi], 
+               [fibers.x_focal[positions], fibers.y_focal[positions], theta], 
+               [x, y, theta + phi]]
+    circles = np.zeros((np.size(positions), 3, 3))
+    for k in range(3):
+        cx, cy, radius = reference[k]
+        x0, y0, angle = origins[k]
+        circles[:,k,0] = x0 + cx*np.cos(angle) - cy*np.sin(angle)
+        circles[:,k,1] = y0 + cx*np.sin(angle) + cy*np.cos(angle)
+        circles[:,k,2] = radius
+    return circles
+
+def may_collide(circles_A, circles_B):
+    """
+    Cheap test that rules out most pairs of positioners before the polygon test.
+
+    Args:
+        circles_A (float): circles of positioners A, as returned by collision_circles
+        circles_B (float): circles of positioners B, as returned by collision_circles
+    Returns:
+       1D array, False for the pairs that can not collide, True for the pairs whose
+       polygons have to be checked.
+    """
+    def overlap(a, b):
+        return (a[:,0] - b[:,0])**2 + (a[:,1] - b[:,1])**2 <= (a[:,2] + b[:,2])**2
+    return (overlap(circles_A[:,0], circles_B[:,0]) | overlap(circles_A[:,2], circles_B[:,1]) |
+            overlap(circles_B[:,2], circles_A[:,1]))
+
+def collision_polygons(pos):
+    """
+    Returns the polygons of a positioner used to check for collisions.
+
+    Args:
+        pos (object Positioner): object defining the positioner
+    Returns:
+       [upper, central, lower]: shapely polygons
+    """
+    return [shapeg.Polygon(pos.upper_pos), shapeg.Polygon(pos.central_pos), 
+            shapeg.Polygon(pos.lower_pos)]
+
+def find_polygon_collision_type(polygons_A, polygons_B):
+    """
+    Same as find_collision_type, for polygons already built by collision_polygons.
+    """
+    upper_A_poly, central_A_poly, lower_A_poly = polygons_A
+    upper_B_poly, central_B_poly, lower_B_poly = polygons_B
+
     #Type II collision, Upper part of ferrule A with upper part of ferrule B
     collision_II = False
     if(upper_A_poly.intersects(upper_B_poly)):
@@ -31,3 +140,16 @@ def find_collision_type(pos_A, pos_B):
         collision_III = True
     return [collision_II, collision_III]
 
+def find_collision_type(pos_A, pos_B):
+    """
+    Checks for Type II and Type III collisions between positioners.
+    
+    Args:
+        pos_A (object Positioner): object defining positioner A
+        pos_B (object Positioner): object defining positioner B
+    
+    Returns:
+       [True/False, True/True/False]: according 
+            if TypeII, TypeIII are True/False, respectively
+    """
+    return find_polygon_collision_type(collision_polygons(pos_A), collision_polygons(pos_B))
@@ -0,0 +1,130 @@
+"""
+Reading of Targets_Tile files with a memory-bounded LRU cache of the decoded data.
+"""
+
+import threading
+import collections
+import numpy as np
+from astropy.io import fits
+import quicksurvey
+
+def read_tile(filename):
+    """
+    Reads a Targets_Tile file and projects its targets on the focal plane.
+
+    Args:
+        filename (string): name of the Targets_Tile FITS file
+    Returns:
+        tile_data (dict): with the arrays 'ra', 'dec', 'type', 'id', 'x', 'y'
+            and the header values 'tile_ra', 'tile_dec', 'tile_id'.
+    """
+    hdulist = fits.open(filename)
+    try:
+        tile_data = {}
+        tile_data['ra'] = np.array(hdulist[1].data['RA'])
+        tile_data['dec'] = np.array(hdulist[1].data['DEC'])
+        tile_data['type'] = np.array(hdulist[1].data['OBJTYPE'])
+        tile_data['id'] = np.int_(hdulist[1].data['TARGETID'])
+        tile_data['tile_ra'] = hdulist[1].header['TILE_RA']
+        tile_data['tile_dec'] = hdulist[1].header['TILE_DEC']
+        tile_data['tile_id'] = hdulist[1].header['TILE_ID']
+    finally:
+        hdulist.close()
+    tile_data['x'], tile_data['y'] = quicksurvey.util.radec2xy(tile_data['ra'], tile_data['dec'],
+                                                               tile_data['tile_ra'], tile_data['tile_dec'])
+    return tile_data
+
+def tile_nbytes(tile_data):
+    """
+    Returns the memory used by the arrays of a tile, in bytes.
+    """
+    return sum([value.nbytes for value in tile_data.values() if isinstance(value, np.ndarray)])
+
+class TileCache(object):
+    """
+    Keeps the decoded data of the most recently used tiles, up to a maximum size.
+
+    Attributes:
+        The properties initialized in the __init__ procedure:
+        max_bytes (int): maximum memory used by the cached arrays, in bytes
+        n_bytes (int): memory currently used by the cached arrays, in bytes
+        hits (int): number of requests served from the cache
+        misses (int): number of requests that had to read the file
+        evictions (int): number of tiles removed from the cache to make space
+    Note:
+        The cached arrays are read-only and shared by all the TargetTile objects
+        built from them. The cache can be used from several threads.
+    """
+    def __init__(self, max_bytes=1024**3):
+        """
+        Args:
+            max_bytes (int): maximum memory used by the cached arrays, in bytes.
+                Defaults to 1 GB.
+        """
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """
+        Returns the decoded data of a tile, reading the file if it is not cached.
+
+        Args:
+            filename (string): name of the Targets_Tile FITS file
+        Returns:
+            tile_data (dict): as returned by read_tile, with read-only arrays.
+        Note:
+            A tile larger than max_bytes is returned but not cached.
+        """
+        with self._lock:
+            if(filename in self._tiles):
+                # moves the tile to the most recently used end
+                tile_data = self._tiles.pop(filename)
+                self._tiles[filename] = tile_data
+                self.hits = self.hits + 1
+                return tile_data
+            self.misses = self.misses + 1
+
+        # the file is read outside the lock so that several threads can read at once
+        tile_data = read_tile(filename)
+        for value in tile_data.values():
+            if(isinstance(value, np.ndarray)):
+                value.flags.writeable = False
+        size = tile_nbytes(tile_data)
+        if(size > self.max_bytes):
+            return tile_data
+
+        with self._lock:
+            if(filename not in self._tiles):
+                while(self.n_bytes + size > self.max_bytes):
+                    oldest, oldest_data = self._tiles.popitem(last=False)
+                    self.n_bytes = self.n_bytes - tile_nbytes(oldest_data)
+                    self.evictions = self.evictions + 1
+                self._tiles[filename] = tile_data
+                self.n_bytes = self.n_bytes + size
+        return tile_data
+
+    def clear(self):
+        """
+        Removes all the tiles from the cache. The statistics are kept.
+        """
+        with self._lock:
+            self._tiles.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        """
+        Returns the usage statistics of the cache.
+
+        Returns:
+            stats (dict): with the keys 'hits', 'misses', 'evictions', 'n_tiles',
+                 'n_bytes' and 'max_bytes'.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'n_tiles': len(self._tiles), 'n_bytes': self.n_bytes,
+                    'max_bytes': self.max_bytes}